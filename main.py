@@ -3,9 +3,12 @@ import time
 import re
 import base64
 import os
+import atexit
+import threading
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
+from selenium.common.exceptions import InvalidSessionIdException, NoSuchWindowException, WebDriverException
 
 # Try importing for local dev, handle failure for Cloud
 try:
@@ -13,6 +16,9 @@ try:
 except ImportError:
     ChromeDriverManager = None
 
+_SCRIBD_RE = re.compile(r'https://www\.scribd\.com/document/(\d+)/')
+_EMBED_RE = re.compile(r'embeds/(\d+)/')
+
 # 1. Page Configuration
 st.set_page_config(
     page_title="Scribd to PDF",
@@ -24,7 +30,7 @@ st.set_page_config(
 # 2. Custom CSS for UI Polish
 st.markdown("""
     <style>
-    .stButton>button {
+    .stButton>button, .stFormSubmitButton>button {
         width: 100%;
         border-radius: 5px;
         height: 3em;
@@ -55,156 +61,338 @@ with st.sidebar:
     st.caption("⚠️ For educational purposes only. Please respect copyright laws.")
 
 # 4. Helper Functions
+@st.cache_data(max_entries=64)
 def convert_scribd_link(url):
-    match = re.search(r'https://www\.scribd\.com/document/(\d+)/', url)
-    if match:
-        doc_id = match.group(1)
-        return f'https://www.scribd.com/embeds/{doc_id}/content'
+    match = _SCRIBD_RE.match(url.strip())
+    return f'https://www.scribd.com/embeds/{match.group(1)}/content' if match else None
+
+@st.cache_resource
+def _driver_path():
+    # Cloud vs Local Logic
+    if os.path.exists("/usr/bin/chromedriver"):
+        return "/usr/bin/chromedriver"
+    if ChromeDriverManager:
+        return ChromeDriverManager().install()
     return None
 
+@st.cache_resource
 def setup_driver():
     chrome_options = Options()
     chrome_options.add_argument("--headless=new")
     chrome_options.add_argument("--disable-gpu")
     chrome_options.add_argument("--no-sandbox")
     chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--enable-features=ParallelDownloading")
+    chrome_options.add_argument(
+        "--disable-features=OptimizationHints,InterestFeedContentSuggestions,"
+        "Translate,MediaRouter,BackForwardCache,AcceptCHFrame"
+    )
+    chrome_options.add_argument("--blink-settings=imagesEnabled=true")
+    chrome_options.add_argument("--disable-background-networking")
+    chrome_options.add_argument("--disable-extensions")
+    chrome_options.add_argument("--disable-sync")
+    chrome_options.add_argument("--disable-background-timer-throttling")
+    chrome_options.add_argument("--disable-renderer-backgrounding")
+    chrome_options.add_argument("--no-first-run")
+    chrome_options.add_argument("--no-default-browser-check")
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-logging"])
     
-    # Cloud vs Local Logic
     if os.path.exists("/usr/bin/chromium"):
         chrome_options.binary_location = "/usr/bin/chromium"
-        service = Service("/usr/bin/chromedriver")
-    else:
-        if ChromeDriverManager:
-            service = Service(ChromeDriverManager().install())
-        else:
-            st.error("❌ Driver not found. Please install webdriver-manager locally.")
-            return None
 
-    return webdriver.Chrome(service=service, options=chrome_options)
+    driver_path = _driver_path()
+    if not driver_path:
+        st.error("❌ Driver not found. Please install webdriver-manager locally.")
+        return None
+
+    driver = webdriver.Chrome(service=Service(driver_path), options=chrome_options)
+    atexit.register(driver.quit)
+    return driver
+
+@st.cache_resource
+def driver_lock():
+    # One shared browser, so conversions from different sessions take turns
+    return threading.RLock()
+
+def is_alive(driver):
+    try:
+        driver.current_url
+        return True
+    except Exception:
+        return False
 
-def generate_pdf(target_url, status_container):
+def get_driver():
+    # Reuse the cached browser; rebuild it if it stopped responding
     driver = setup_driver()
+    if driver and not is_alive(driver):
+        discard_driver(driver)
+        driver = setup_driver()
+    return driver
+
+def discard_driver(driver):
+    setup_driver.clear()
+    atexit.unregister(driver.quit)
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+def reset_driver(driver):
+    # Leave the shared browser clean for the next conversion
+    try:
+        driver.delete_all_cookies()
+        driver.get("about:blank")
+    except WebDriverException:
+        discard_driver(driver)
+
+def wait_for_network_idle(driver, timeout, quiet=0.5):
+    # Poll until the page has loaded and no new resources arrive for `quiet` seconds,
+    # giving up after `timeout` seconds
+    idle_script = """
+    if (document.readyState !== 'complete') return -1;
+    var count = performance.getEntriesByType('resource').length;
+    performance.clearResourceTimings();
+    return count;
+    """
+    deadline = time.monotonic() + timeout
+    quiet_since = time.monotonic()
+    delay = 0.05
+    while time.monotonic() < deadline:
+        if driver.execute_script(idle_script) != 0:
+            quiet_since = time.monotonic()
+        elif time.monotonic() - quiet_since >= quiet:
+            return
+        time.sleep(delay)
+        delay = min(delay * 2, 0.25)
+
+def evaluate(driver, expression):
+    # Run JS through CDP directly, awaiting it if it returns a promise
+    result = driver.execute_cdp_cmd("Runtime.evaluate", {
+        "expression": expression,
+        "awaitPromise": True,
+        "returnByValue": True
+    })
+    if "exceptionDetails" in result:
+        details = result["exceptionDetails"]
+        message = details.get("exception", {}).get("description") or details.get("text", "Script failed")
+        raise RuntimeError(message)
+    return result["result"].get("value")
+
+def generate_pdf(target_url, status_container, retry=True):
+    with driver_lock():
+        return _generate_pdf(target_url, status_container, retry)
+
+def _generate_pdf(target_url, status_container, retry):
+    try:
+        driver = get_driver()
+    except WebDriverException as e:
+        st.error(f"Error: {str(e)}")
+        return None
     if not driver:
         return None
     
     try:
         # Step 1: Load
         status_container.write("🌐 Launching browser...")
+        # Block trackers and ads that never make it into the PDF
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": [
+            "*doubleclick*", "*google-analytics*", "*onetrust*", "*optimizely*", "*/promos/*"
+        ]})
         driver.get(target_url)
-        time.sleep(3)
+        wait_for_network_idle(driver, 3)
 
         # Step 2: Scroll
         status_container.write("📜 Scrolling to render pages (this takes time)...")
-        page_elements = driver.find_elements("css selector", "[class*='page']")
+        # Scroll a range of pages in the browser, resolving once their images load.
+        # Pages are scrolled a few ahead of the one being awaited so their loads overlap,
+        # and the walk stops early once `deadline` passes.
+        scroll_script = """
+        async function scrollPages(start, end, deadline) {
+            const pages = window.__pages;
+            // An image with a src that is complete has already loaded or failed; one
+            // without a src has not been requested yet
+            const settled = img => img.getAttribute('src') && img.complete;
+            // Wait for an image's load or error event, giving up after `ms`
+            const settle = (img, ms) => new Promise(resolve => {
+                const timer = setTimeout(resolve, ms);
+                const done = () => { clearTimeout(timer); resolve(); };
+                img.addEventListener('load', done, {once: true});
+                img.addEventListener('error', done, {once: true});
+            });
+            // Give the page a rendered frame so its scroll handler can run
+            const frame = () => new Promise(resolve => requestAnimationFrame(() => setTimeout(resolve)));
+            window.__ahead = window.__ahead || 0;
+            for (let i = start; i < Math.min(end, pages.length); i++) {
+                // Keep the next few pages loading while we wait on this one. Each look-ahead
+                // scroll gets its own rendered frame, so no page is skipped over in a burst.
+                const last = Math.min(i + 4, pages.length - 1);
+                while (window.__ahead <= last) {
+                    pages[window.__ahead++].scrollIntoView({block: 'end'});
+                    await frame();
+                }
+                // Skip the wait for pages that are already rendered, and cap it at 2s otherwise
+                const pending = [...pages[i].querySelectorAll('img')].filter(img => !settled(img));
+                if (pending.length) {
+                    await Promise.all(pending.map(img => settle(img, 2000)));
+                }
+                window.__progress = i + 1;
+                if (Date.now() >= deadline) break;
+            }
+            return window.__progress || 0;
+        }
+        """
+        
+        # Query the pages once and keep them in the browser
+        total_pages = evaluate(driver, "(window.__pages = document.querySelectorAll(\"[class*='page']\")).length")
         
         # Simple progress bar inside the status container
         progress_bar = status_container.progress(0)
-        total_pages = len(page_elements)
         
-        for index, page in enumerate(page_elements):
-            driver.execute_script("arguments[0].scrollIntoView();", page)
-            time.sleep(0.4) # Optimized timing
-            if total_pages > 0:
-                progress_bar.progress(min((index + 1) / total_pages, 1.0))
+        # Report back at most ~50 times, so long documents don't flood the frontend,
+        # and give each chunk at most 60s so the shared browser is never held by one long call
+        step = max(20, total_pages // 50)
+        done = 0
+        while done < total_pages:
+            done = evaluate(driver, "(async () => {%s return await scrollPages(%d, %d, Date.now() + 60000); })()" % (
+                scroll_script, done, done + step
+            ))
+            progress_bar.progress(min(done / total_pages, 1.0))
         
-        time.sleep(1) 
+        wait_for_network_idle(driver, 1)
         
         # Step 3: Cleanup
         status_container.write("🧹 Removing banners and cookies...")
         cleanup_script = """
-        // Remove standard toolbars
-        document.querySelectorAll('.toolbar_top, .toolbar_bottom').forEach(el => el.remove());
-        
-        // Remove scroller styles
-        var scrollers = document.getElementsByClassName("document_scroller");
-        for (var i = 0; i < scrollers.length; i++) { scrollers[i].setAttribute('class', ''); }
+        function cleanup() {
+            // Only clean a page once
+            if (window.__scribd_cleaned) return;
+            window.__scribd_cleaned = true;
         
-        // Remove promos
-        document.querySelectorAll('[class*="promo"]').forEach(el => el.remove());
+            // Remove OneTrust/Cookie Banners
+            ['onetrust-consent-sdk', 'onetrust-banner-sdk'].forEach(id => {
+                var el = document.getElementById(id);
+                if (el) el.remove();
+            });
         
-        // Remove OneTrust/Cookie Banners
-        var ids = ['onetrust-consent-sdk', 'onetrust-banner-sdk'];
-        ids.forEach(id => {
-            var el = document.getElementById(id);
-            if(el) el.remove();
-        });
-
-        // Text content fallback removal
-        document.querySelectorAll('div, footer').forEach(el => {
-            if (el.textContent && el.textContent.includes('This website utilizes technologies such as cookies')) {
-                el.remove();
-            }
-        });
+            // Classify every remaining element in a single pass
+            var kill = [];
+            var candidates = [];
+            document.querySelectorAll('*').forEach(el => {
+                var c = el.getAttribute('class') || '';
+                if (el.classList.contains('toolbar_top') || el.classList.contains('toolbar_bottom') || c.includes('promo')) {
+                    // Remove standard toolbars and promos
+                    kill.push(el);
+                } else {
+                    if (el.classList.contains('document_scroller')) {
+                        // Remove scroller styles
+                        el.setAttribute('class', '');
+                    }
+                    if (el.tagName === 'DIV' || el.tagName === 'FOOTER') candidates.push(el);
+                }
+            });
+            kill.forEach(el => el.remove());
+            
+            // Text content fallback removal, once toolbars and promos are gone
+            candidates.forEach(el => {
+                if (el.isConnected && el.textContent.includes('This website utilizes technologies such as cookies')) {
+                    el.remove();
+                }
+            });
         
-        // CSS Injection
-        var style = document.createElement('style');
-        style.textContent = `
-            @media print {
-                @page { margin: 0; }
-                body { background-color: white; }
-                .toolbar_top, .toolbar_bottom, .promo_banner, #onetrust-consent-sdk { display: none !important; }
-            }
-        `;
-        document.head.appendChild(style);
+            // CSS Injection
+            var style = document.createElement('style');
+            style.textContent = `
+                @media print {
+                    @page { margin: 0; }
+                    body { background-color: white; }
+                    .toolbar_top, .toolbar_bottom, .promo_banner, #onetrust-consent-sdk { display: none !important; }
+                }
+            `;
+            document.head.appendChild(style);
+        }
         """
-        driver.execute_script(cleanup_script)
+        evaluate(driver, cleanup_script + "cleanup();")
         
         # Step 4: Print
         status_container.write("🖨️ Generating PDF...")
-        pdf_data = driver.execute_cdp_cmd("Page.printToPDF", {
+        handle = driver.execute_cdp_cmd("Page.printToPDF", {
             "printBackground": True,
             "preferCSSPageSize": True,
-            "marginTop": 0, "marginBottom": 0, "marginLeft": 0, "marginRight": 0
-        })
+            "marginTop": 0, "marginBottom": 0, "marginLeft": 0, "marginRight": 0,
+            "transferMode": "ReturnAsStream"
+        })["stream"]
+        
+        # Read the PDF back in chunks rather than as one base64 string
+        buf = bytearray()
+        try:
+            while True:
+                chunk = driver.execute_cdp_cmd("IO.read", {"handle": handle, "size": 1 << 20})
+                if chunk.get("base64Encoded"):
+                    buf += base64.b64decode(chunk["data"])
+                else:
+                    buf += chunk["data"].encode()
+                if chunk.get("eof"):
+                    break
+        finally:
+            driver.execute_cdp_cmd("IO.close", {"handle": handle})
         
-        return base64.b64decode(pdf_data['data'])
+        pdf_bytes = bytes(buf)
+        reset_driver(driver)
+        return pdf_bytes
 
+    except (InvalidSessionIdException, NoSuchWindowException) as e:
+        # The cached browser lost its session; start a fresh one and try once more
+        discard_driver(driver)
+        if retry:
+            return generate_pdf(target_url, status_container, retry=False)
+        st.error(f"Error: {str(e)}")
+        return None
     except Exception as e:
+        reset_driver(driver)
         st.error(f"Error: {str(e)}")
         return None
-    finally:
-        driver.quit()
 
 # 5. Main UI Layout
 st.title("📖 Scribd Downloader")
 st.write("Convert Scribd documents to PDF for offline reading.")
 
-url_input = st.text_input("Document URL", placeholder="Paste https://www.scribd.com/document/... here")
+# Only rerun the conversion on submit, not on every keystroke
+with st.form("convert"):
+    url_input = st.text_input("Document URL", placeholder="Paste https://www.scribd.com/document/... here")
+    submitted = st.form_submit_button("🚀 Convert to PDF", type="primary")
 
-# Check if URL is entered before showing the button
-if url_input:
-    # Use columns to make the button not span the whole width if desired, 
-    # but full width (via CSS above) looks good on mobile.
-    if st.button("🚀 Convert to PDF", type="primary"):
-        embed_url = convert_scribd_link(url_input)
-        
-        if embed_url:
-            # The 'st.status' container is great for multi-step processes
-            with st.status("Processing document...", expanded=True) as status:
-                pdf_bytes = generate_pdf(embed_url, status)
+if submitted and url_input:
+    embed_url = convert_scribd_link(url_input)
+    
+    if embed_url:
+        # The 'st.status' container is great for multi-step processes
+        with st.status("Processing document...", expanded=True) as status:
+            pdf_bytes = generate_pdf(embed_url, status)
+            
+            if pdf_bytes:
+                status.update(label="✅ Conversion Complete!", state="complete", expanded=False)
                 
-                if pdf_bytes:
-                    status.update(label="✅ Conversion Complete!", state="complete", expanded=False)
-                    
-                    # Success UI
-                    st.balloons()
-                    
-                    # Extract ID for filename
-                    doc_id = re.search(r'embeds/(\d+)/', embed_url).group(1)
-                    file_name = f"scribd_doc_{doc_id}.pdf"
-                    
-                    st.success("Your document is ready!")
-                    
-                    col1, col2, col3 = st.columns([1,2,1])
-                    with col2:
-                        st.download_button(
-                            label="⬇️ Download PDF",
-                            data=pdf_bytes,
-                            file_name=file_name,
-                            mime="application/pdf",
-                            type="primary"
-                        )
-        else:
-            st.toast("Invalid URL format. Please check the link.", icon="⚠️")
+                # Success UI
+                st.balloons()
+                
+                # Extract ID for filename
+                doc_id = _EMBED_RE.search(embed_url).group(1)
+                file_name = f"scribd_doc_{doc_id}.pdf"
+                
+                st.success("Your document is ready!")
+                
+                col1, col2, col3 = st.columns([1,2,1])
+                with col2:
+                    st.download_button(
+                        label="⬇️ Download PDF",
+                        data=pdf_bytes,
+                        file_name=file_name,
+                        mime="application/pdf",
+                        type="primary",
+                        width="stretch"
+                    )
+    else:
+        st.toast("Invalid URL format. Please check the link.", icon="⚠️")
 else:
     st.info("Paste a URL above to get started.")